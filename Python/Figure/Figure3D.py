@@ -21,49 +21,52 @@ Figure3D
 import math
 import numpy
 from vtk import *
+from vtk.util import numpy_support
 
 
 class Figure3D:
 
     """
     This class creates vtk objects for 3D viewing.
-    The class elements contain vtkStructuredGrid, vtkActor, vtkRenderer, vtkRenderWindow
+    The class elements contain vtkImageData, vtkActor, vtkRenderer, vtkRenderWindow
     """
 
     def __init__(self, axes, data):
-        self.vmax = max(data)
+        """
+        axes: 1D velocity axes (uniform)
+        data: fxyz of one species, raveled in C order
+        """
+        # VTK uses these buffers without copying them, so they are kept
+        # alive with the figure
+        self.data = numpy.ascontiguousarray(data, 'f4')
+        self.axes = numpy.asarray(axes, 'f8')
+        self.vmax = self.data.max()
         self.box = axes[-1]
 
-        val = vtkFloatArray()
-        val.SetVoidArray(data, len(data), 1)
-
-        points = vtkPoints()
-        for x in axes:
-            for y in axes:
-                for z in axes:
-                    points.InsertNextPoint(z, y, x)
-
+        # the last (fastest) index of fxyz is along x
         ng = len(axes)
-        self.sgrid = vtkStructuredGrid()
-        self.sgrid.SetDimensions(ng, ng, ng)
-        self.sgrid.SetPoints(points)
-        self.sgrid.GetPointData().SetScalars(val)
+        self.image = vtkImageData()
+        self.image.SetDimensions(ng, ng, ng)
+        self.image.SetOrigin(self.axes[0], self.axes[0], self.axes[0])
+        d = self.axes[1] - self.axes[0]
+        self.image.SetSpacing(d, d, d)
+        val = numpy_support.numpy_to_vtk(self.data, deep=0)
+        self.image.GetPointData().SetScalars(val)
 
     def set_up_color(self):
-        color = vtkDoubleArray()
+        ng = len(self.axes)
+        Lx = numpy.linspace(-1, 1, ng)
+        r = numpy.sqrt(Lx[:, None, None] ** 2 + Lx[None, :, None] ** 2 +
+                       Lx[None, None, :] ** 2)
+        self.color = numpy.zeros((ng ** 3, 3))
+        self.color[:, 0] = ((0.4 - r) * .1).ravel()
+        color = numpy_support.numpy_to_vtk(self.color, deep=0)
         color.SetName("Color")
-        color.SetNumberOfComponents(3)
-        Lx = numpy.linspace(-1, 1, 101)
-        for x in Lx:
-            for y in Lx:
-                for z in Lx:
-                    r = math.sqrt(x * x + y * y + z * z)
-                    color.InsertNextTuple3((0.4 - r) * .1, 0, 0)
-        self.sgrid.GetPointData().SetVectors(color)
+        self.image.GetPointData().SetVectors(color)
 
     def set_up_iso_surface(self, isovalue):
         iso = vtkContourFilter()
-        iso.SetInput(self.sgrid)
+        iso.SetInput(self.image)
         iso.SetValue(0, isovalue)
 
         normals = vtkPolyDataNormals()
@@ -80,6 +83,49 @@ class Figure3D:
         self.Actor_iso = vtkActor()
         self.Actor_iso.SetMapper(isoMapper)
 
+    def set_up_mesh(self, vert, face):
+        """
+        Use a precomputed isosurface instead of the contour filter
+        vert: vertices in grid index units of the data array
+        face: triangles
+        """
+        ng = len(self.axes)
+        # the data index (i, j, k) is at the point (axes[k], axes[j], axes[i])
+        index = numpy.asarray(vert, 'f8')[:, ::-1]
+        pts = numpy.interp(index, numpy.arange(ng), self.axes)
+        r = numpy.sqrt(((index / (ng - 1) * 2 - 1) ** 2).sum(axis=1))
+        col = numpy.zeros((len(index), 3))
+        col[:, 0] = (0.4 - r) * .1
+        cells = numpy.empty((len(face), 4), numpy_support.ID_TYPE_CODE)
+        cells[:, 0] = 3
+        cells[:, 1:] = face
+
+        points = vtkPoints()
+        points.SetData(numpy_support.numpy_to_vtk(pts, deep=1))
+        polys = vtkCellArray()
+        polys.SetCells(len(face),
+                       numpy_support.numpy_to_vtkIdTypeArray(cells.ravel(),
+                                                             deep=1))
+        color = numpy_support.numpy_to_vtk(col, deep=1)
+        color.SetName("Color")
+        mesh = vtkPolyData()
+        mesh.SetPoints(points)
+        mesh.SetPolys(polys)
+        mesh.GetPointData().SetVectors(color)
+
+        normals = vtkPolyDataNormals()
+        normals.SetInput(mesh)
+
+        isoMapper = vtkPolyDataMapper()
+        isoMapper.SetInput(normals.GetOutput())
+        isoMapper.SetScalarRange(0, self.vmax)
+        isoMapper.SetScalarModeToUsePointFieldData()
+        isoMapper.SetColorModeToMapScalars()
+        isoMapper.SelectColorArray("Color")
+
+        self.Actor_iso = vtkActor()
+        self.Actor_iso.SetMapper(isoMapper)
+
     def add_other_stuff(self):
         r = self.box
         # add Y axis
@@ -116,8 +162,8 @@ class Figure3D:
         self.Actor_axes.GetYAxisCaptionActor2D().SetCaptionTextProperty(tp)
         self.Actor_axes.GetZAxisCaptionActor2D().SetCaptionTextProperty(tp)
         # add a bounding box
-        box = vtkStructuredGridOutlineFilter()
-        box.SetInput(self.sgrid)
+        box = vtkOutlineFilter()
+        box.SetInput(self.image)
         Mapper_box = vtkPolyDataMapper()
         Mapper_box.SetInput(box.GetOutput())
         self.Actor_box = vtkActor()
@@ -76,7 +76,7 @@ class PanelD2DCtrl(wx.Panel):
 
     # Create a Radio Box for 2D plot selections
     #
-        plist = ['fxy', 'fxz', 'fyz', 'xcut', 'ycut', 'zcut']
+        plist = ['fxy', 'fxz', 'fyz', 'xcut', 'ycut', 'zcut', 'plane']
         self.rb_key = wx.RadioBox(self, label='Select a plot',
                                   choices=plist,
                                   majorDimension=3, style=wx.RA_SPECIFY_COLS)
@@ -89,6 +89,24 @@ class PanelD2DCtrl(wx.Panel):
                                  size=(150, -1), minValue = 0,
                                  style = wx.SL_HORIZONTAL | wx.SL_LABELS)
 
+    # Create Sliders for the range of planes summed by a cut
+    #
+        st_range = wx.StaticText(self, label='Cut range:')
+        grid = len(self.p.p.pdist['axes'][0])
+        self.slr_range = [wx.Slider(self, value=v,
+                                    size=(150, -1), minValue = 0,
+                                    maxValue = grid - 1,
+                                    style = wx.SL_HORIZONTAL | wx.SL_LABELS)
+                          for v in self.p.cut_range]
+
+    # Create a Text Control for the normal of a plane
+    #
+        st_normal = wx.StaticText(self, label='Plane normal:')
+        self.tc_normal = wx.TextCtrl(self, value='0,0,1')
+        sizer_normal = wx.BoxSizer(wx.HORIZONTAL)
+        sizer_normal.Add(st_normal, 0, flags)
+        sizer_normal.Add(self.tc_normal, 0, flags)
+
     # Create Buttons for reloading data and redraw
     #
         self.btn_apply = wx.Button(self, label='Apply')
@@ -103,6 +121,10 @@ class PanelD2DCtrl(wx.Panel):
         sizer = wx.BoxSizer(wx.VERTICAL)
         sizer.Add(self.rb_key, 0, flags, pad)
         sizer.Add(self.slr_cut, 100, flags, pad)
+        sizer.Add(st_range, 0, flags, pad)
+        for slr in self.slr_range:
+            sizer.Add(slr, 0, flags, pad)
+        sizer.Add(sizer_normal, 0, flags, pad)
         sizer.Add(sizer_refresh, 0, flags, pad)
         self.SetSizerAndFit(sizer)
 
@@ -116,6 +138,7 @@ class FrameD2D(wx.Frame):
     """
     cut_dir = 'x'
     cut = 0
+    cut_range = [40, 60]
     X = Y = C = None
 
     def __init__(self, parent, *args, **kwargs):
@@ -127,6 +150,10 @@ class FrameD2D(wx.Frame):
     #
         self.p = parent
 
+    # Cuts of any thickness are differences of cumulative sums
+    #
+        self.p.pdist.index_cuts()
+
     # Create a Display Panel
     #
         self.disp = PanelD2DDisp(self)
@@ -154,6 +181,8 @@ class FrameD2D(wx.Frame):
     #
         self.Bind(wx.EVT_RADIOBOX, self.on_rb_key, self.ctrl.rb_key)
         self.Bind(wx.EVT_SCROLL, self.on_slr_cut, self.ctrl.slr_cut)
+        for slr in self.ctrl.slr_range:
+            self.Bind(wx.EVT_SCROLL, self.on_slr_range, slr)
         self.Bind(wx.EVT_BUTTON, self.on_btn_apply,
                   self.ctrl.btn_apply)
         self.Bind(wx.EVT_BUTTON, self.on_btn_draw,
@@ -170,11 +199,32 @@ class FrameD2D(wx.Frame):
         self.key = self.ctrl.rb_key.GetItemLabel(
             self.ctrl.rb_key.GetSelection())
         if self.key in ['xcut', 'ycut', 'zcut']:
-            cut_range = [self.key[0], 40, 60]
-            self.p.pdist.cut(cut_range)
+            self.p.pdist.cut([self.key[0]] + self.cut_range)
+        elif self.key == 'plane':
+            try:
+                normal = [float(v) for v in
+                          self.ctrl.tc_normal.GetValue().split(',')]
+                # three finite components, not all zero
+                if len(normal) != 3 or \
+                        not 0 < sum(v * v for v in normal) < float('inf'):
+                    raise ValueError
+                e1, e2 = self.p.pdist.perpendicular(normal)
+            except ValueError:
+                self.status_message('Error: normal should be nx,ny,nz')
+                return
+            # a plane as thick as the cut range, at the centre of the grid
+            thickness = self.cut_range[1] - self.cut_range[0] + 1
+            self.plane = self.p.pdist.slice_plane(e1, e2,
+                                                  thickness=thickness)
         self.on_btn_apply(event)
         self.on_btn_draw(event)
 
+    def on_slr_range(self, event):
+        """ Change the range of a cut
+        """
+        self.cut_range = sorted(slr.GetValue() for slr in self.ctrl.slr_range)
+        self.on_rb_key(event)
+
     def on_slr_cut(self, event):
         """ Change the cut value
         """
@@ -185,7 +235,10 @@ class FrameD2D(wx.Frame):
     def on_btn_apply(self, event):
         """ Apply settings
         """
-        self.X = self.Y = self.p.pdist['axes']
+        if self.key == 'plane':
+            self.X = self.Y = self.plane[0]
+        else:
+            self.X = self.Y = self.p.pdist['axes']
 
     def on_btn_draw(self, event):
         """ Draw the figure
@@ -200,6 +253,10 @@ class FrameD2D(wx.Frame):
         elif self.key in ['fyz', 'xcut']:
             Lx = 'Vy'
             Ly = 'Vz'
+        elif self.key == 'plane':
+            title += ' normal=(' + self.ctrl.tc_normal.GetValue() + ')'
+            Lx = 'V1'
+            Ly = 'V2'
         else:
             Lx = ''
             Ly = ''
@@ -207,6 +264,8 @@ class FrameD2D(wx.Frame):
             N = 4
             if self.key in ['fxy', 'fxz', 'fyz']:
                 self.Z = self.p.pdist[self.key]
+            elif self.key == 'plane':
+                self.Z = self.plane[1]
             else:
                 self.Z = self.p.pdist[self.key.lstrip('xyz')]
         else:
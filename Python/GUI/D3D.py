@@ -18,6 +18,7 @@ D3D
 """
 
 
+import os
 import wx
 import matplotlib
 matplotlib.use('wxAgg')
@@ -54,8 +55,11 @@ class PanelD3DDisp(wx.Panel):
         sizer.Add(self.toolbar, 0)
         self.SetSizerAndFit(sizer)
 
-    def draw(self, title, Lx, Ly, Lz, X, Y, Z, f, iso, elev, azim):
-        self.fig.draw_one(title, Lx, Ly, Lz, X, Y, Z, f, iso, elev, azim)
+    def draw(self, title, Lx, Ly, Lz, X, Y, Z, f, iso, elev, azim, key=None,
+             budget=None):
+        self.fig.draw_one(title, Lx, Ly, Lz, X, Y, Z, f, iso, elev, azim,
+                          key, budget)
+        return self.fig.stats
 
 
 class PanelD3DCtrl(wx.Panel):
@@ -96,6 +100,10 @@ class PanelD3DCtrl(wx.Panel):
                                  size=(150, -1), minValue = 10, maxValue = 90,
                                  style = wx.SL_HORIZONTAL | wx.SL_LABELS)
 
+    # Create a Check Box to mesh in parallel chunks
+    #
+        self.cb_parallel = wx.CheckBox(self, label='parallel meshing')
+
     # Create a Text Control to modify range
     #
         st_range_label = wx.StaticText(self, label='Drawing Range:')
@@ -123,12 +131,15 @@ class PanelD3DCtrl(wx.Panel):
         sizer_view.Add(self.sc_azim, 0, flags)
 
     # Create Buttons for reloading data and redraw
+    # (Draw makes a coarse mesh, Full the full resolution one)
     #
         self.btn_load = wx.Button(self, label='Load')
         self.btn_draw = wx.Button(self, label='Draw')
+        self.btn_full = wx.Button(self, label='Full')
         sizer_refresh = wx.BoxSizer(wx.HORIZONTAL)
         sizer_refresh.Add(self.btn_load, 0, flags)
         sizer_refresh.Add(self.btn_draw, 0, flags)
+        sizer_refresh.Add(self.btn_full, 0, flags)
 
     # Sizer and Fit
     #
@@ -137,6 +148,7 @@ class PanelD3DCtrl(wx.Panel):
         sizer.Add(self.rb_plot, 0, flags, pad)
         sizer.Add(sizer_iso, 0, flags, pad)
         sizer.Add(self.slr_iso, 0, flags, pad)
+        sizer.Add(self.cb_parallel, 0, flags, pad)
         sizer.Add(wx.StaticLine(self), 0, flags | wx.EXPAND, pad)
         sizer.Add(st_range_label, 0, flags)
         sizer.Add(sizer_range, 0, flags, pad)
@@ -155,10 +167,12 @@ class PanelD3D(wx.Panel):
 #
     grid = 101
     iso = 20
+    triangles = 50000
 
 # data
 #
     pdist = None
+    fname = None
 
     def __init__(self, parent, *args, **kwargs):
         wx.Panel.__init__(self, parent, *args, **kwargs)
@@ -192,8 +206,11 @@ class PanelD3D(wx.Panel):
     #
         self.Bind(wx.EVT_RADIOBOX, self.on_rb_plot, self.ctrl.rb_plot)
         self.Bind(wx.EVT_SCROLL, self.on_slr_iso, self.ctrl.slr_iso)
+        self.Bind(wx.EVT_CHECKBOX, self.on_cb_parallel,
+                  self.ctrl.cb_parallel)
         self.Bind(wx.EVT_BUTTON, self.on_btn_load, self.ctrl.btn_load)
         self.Bind(wx.EVT_BUTTON, self.on_btn_draw, self.ctrl.btn_draw)
+        self.Bind(wx.EVT_BUTTON, self.on_btn_full, self.ctrl.btn_full)
 
     def load_data(self):
         """ Update pdist if the file is valid
@@ -204,11 +221,14 @@ class PanelD3D(wx.Panel):
         f = self.p.pathname
         try:
             self.p.status_message('Loading')
-            self.pdist = PIC.DistNASA(f, self.grid)
+            self.pdist = PIC.snapshot_cache.load(PIC.DistNASA, f, self.grid)
+            st = os.stat(f)
+            self.fname = (os.path.abspath(f), st.st_mtime, st.st_size)
             self.p.status_message('Done')
         except:
             self.p.status_message('Error: Load Fail!')
             self.pdist = None
+            self.fname = None
         if self.pdist:
             self.p.status_message('Loaded ' + f)
 
@@ -230,6 +250,11 @@ class PanelD3D(wx.Panel):
         """
         self.iso = self.ctrl.slr_iso.GetValue()
 
+    def on_cb_parallel(self, event):
+        """ Mesh with all cores, or with a single marching cubes call
+        """
+        self.disp.fig.processes = None if event.IsChecked() else 1
+
     def on_btn_load(self, event):
         """ Load the data
         """
@@ -237,7 +262,18 @@ class PanelD3D(wx.Panel):
         self.load_data()
 
     def on_btn_draw(self, event):
+        """ Draw the figure with a coarse mesh of about self.triangles
+        """
+        self.draw(self.triangles)
+
+    def on_btn_full(self, event):
+        """ Draw the figure with the full resolution mesh
+        """
+        self.draw(None)
+
+    def draw(self, budget):
         """ Draw the figure
+            budget: number of triangles (None: full resolution)
         """
         if not self.pdist:
             dlg = wx.MessageDialog(self, 'Load Data First!',
@@ -262,17 +298,20 @@ class PanelD3D(wx.Panel):
             X = Y = Z = self.pdist['axes'][self.plot]
             f = self.pdist['fxyz'][self.plot]
         elif self.plot == 4:
-            X = Y = Z = self.pdist['axes'][0]
-            f = self.pdist['fxyz'][0] + self.pdist['fxyz'][2]
+            X = Y = Z = self.pdist.common_axes([0, 2])
+            f = self.pdist.combine('fxyz', [0, 2], regrid=True)
         elif self.plot == 5:
-            X = Y = Z = self.pdist['axes'][1]
-            f = self.pdist['fxyz'][1] + self.pdist['fxyz'][3]
-        print f.shape
+            X = Y = Z = self.pdist.common_axes([1, 3])
+            f = self.pdist.combine('fxyz', [1, 3], regrid=True)
         iso = max(f.ravel()) * self.iso / 100
         self.ctrl.tc_iso.SetValue(str(iso))
         elev = self.ctrl.sc_elev.GetValue()
         azim = self.ctrl.sc_azim.GetValue()
+        # the mesh depends on the file, the species and the range only
+        key = (self.fname, self.plot, self.pdist.r)
         self.p.status_message('Drawing')
-        self.disp.draw(title, Lx, Ly, Lz, X, Y, Z, f.transpose(),
-                       iso, elev, azim)
-        self.p.status_message('Done')
+        ntri, factor, t = self.disp.draw(title, Lx, Ly, Lz, X, Y, Z,
+                                         f.transpose(), iso, elev, azim,
+                                         key, budget)
+        self.p.status_message('%d triangles (1/%d resolution), %.2f s' %
+                              (ntri, factor, t))
@@ -199,6 +199,7 @@ class PanelF2D(wx.Panel):
 
     # Load data from file
     #
+        self.catalog = None
         self.load_data()
 
     # Initialize fkey and Draw
@@ -213,6 +214,10 @@ class PanelF2D(wx.Panel):
         self.Bind(wx.EVT_BUTTON, self.on_btn_load, self.ctrl.btn_load)
         self.Bind(wx.EVT_BUTTON, self.on_btn_draw, self.ctrl.btn_draw)
 
+    # Double click on the figure to open a distribution
+    #
+        self.disp.canvas.mpl_connect('button_press_event', self.on_dclick)
+
     def load_data(self):
         """ Update field if the file is valid
         """
@@ -222,7 +227,8 @@ class PanelF2D(wx.Panel):
         f = self.p.pathname
         try:
             self.p.status_message('Loading')
-            self.field = PIC.FieldNASA(f)
+            self.field = PIC.snapshot_cache.load(PIC.FieldNASA, f,
+                                                 mmap=True, lazy_dfac=True)
             self.p.status_message('Done')
         except:
             self.p.status_message('Error: Load Fail!')
@@ -235,6 +241,29 @@ class PanelF2D(wx.Panel):
             self.set_range()
             self.smi = sqrt(self.field.data['mass'][0])
 
+    def on_dclick(self, event):
+        """ Open the distribution whose bin contains a double-clicked point.
+            The distribution files are looked up, by their headers only,
+            in the directory of the field data file.
+        """
+        if not event.dblclick or event.inaxes is None or not self.field:
+            return
+        x = event.xdata
+        z = event.ydata
+        if self.ctrl.tb_scale.GetValue():
+            x *= self.smi
+            z *= self.smi
+        path = os.path.dirname(self.p.pathname)
+        if self.catalog is None or self.catalog.path != path:
+            self.p.status_message('Indexing distributions in ' + path)
+            self.catalog = PIC.DistCatalog(path)
+        bins = self.catalog.find(x, z)
+        if not bins:
+            self.p.status_message('No distribution at x=%g, z=%g' % (x, z))
+            return
+        self.p.status_message('Opening ' + bins[0])
+        self.p.open_D3D(bins[0])
+
     def set_range(self):
         """ Reset the grid range
         """
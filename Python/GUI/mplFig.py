@@ -14,14 +14,16 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import time
 import numpy
-from skimage import measure
 import matplotlib
 matplotlib.use('wxAgg')
 from matplotlib.cm import ScalarMappable
 from matplotlib.figure import Figure
 from mpl_toolkits.mplot3d import Axes3D
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from PIC.Isosurface import marching_cubes_lod
+from PIC import LRUCache
 
 
 name = [r'$p^+$,lo', r'$e^-$,lo', r'$p^+$,hi', r'$e^-$,hi']
@@ -32,40 +34,85 @@ class Figure3D(Figure):
     """ The following draw methods are implemented:
             * 1 subplot
     """
+    # computed meshes, in LRU order within a byte budget
+    mesh_cache = LRUCache(64, budget=2 ** 28)
+    # worker processes for meshing (1: a single marching cubes call)
+    processes = 1
 
     def __init__(self, *args, **kwargs):
         Figure.__init__(self, *args, **kwargs)
+        # work arrays reused across redraws, grown when a mesh is larger
+        self.vbuf = numpy.empty((0, 3))
+        self.cbuf = numpy.empty(0)
+
+    def buffers(self, n, dtype):
+        """ Views of the first n rows of the work arrays
+        """
+        if len(self.cbuf) < n or self.cbuf.dtype != dtype:
+            self.vbuf = numpy.empty((n, 3), dtype)
+            self.cbuf = numpy.empty(n, dtype)
+        return self.vbuf[:n], self.cbuf[:n]
 
     def rescale(self, V, X, Y, Z, N):
-        xs = (X[-1] - X[0]) / N[0]
-        ys = (Y[-1] - Y[0]) / N[1]
-        zs = (Z[-1] - Z[0]) / N[2]
-        for i in xrange(len(V)):
-            V[i][0] = V[i][0] * xs + X[0]
-            V[i][1] = V[i][1] * ys + Y[0]
-            V[i][2] = V[i][2] * zs + Z[0]
+        """ Map the vertices from grid indices to axes values (in place)
+        """
+        scale = numpy.array([(X[-1] - X[0]) / N[0],
+                             (Y[-1] - Y[0]) / N[1],
+                             (Z[-1] - Z[0]) / N[2]], V.dtype)
+        V *= scale
+        V += numpy.array([X[0], Y[0], Z[0]], V.dtype)
 
     def getcolor(self, V, F):
-        dS = numpy.empty(len(F))
-        for i, f in enumerate(F):
-            v = V[f][0]
-            dS[i] = v[0] * v[0] + v[1] * v[1] + v[2] * v[2]
+        """ Colour each face by V^2 of its first vertex
+        """
+        v, dS = self.buffers(len(F), V.dtype)
+        numpy.take(V, F[:, 0], axis=0, out=v)
+        numpy.einsum('ij,ij->i', v, v, out=dS)
         cmap = ScalarMappable(cmap='jet')
         cmap.set_array(dS)
         return cmap, cmap.to_rgba(dS)
 
+    def mesh(self, f, iso, X, Y, Z, key=None, budget=None):
+        """ The isosurface of f at iso: vertices (in axes values), faces,
+            face values V^2, face colours and the downsampling factor.
+            budget: number of triangles to aim at (None: full resolution)
+            With a key describing f (e.g. file, species and range), the
+            mesh is cached under (key, iso, budget).
+        """
+        if key is not None:
+            key = (key, float(iso), budget)
+            if key in self.mesh_cache:
+                return self.mesh_cache[key]
+        if budget is None:
+            budget = numpy.inf
+        vert, face, factor = marching_cubes_lod(f, iso, budget,
+                                                self.processes)
+        self.rescale(vert, X, Y, Z, f.shape)
+        cmap, col = self.getcolor(vert, face)
+        # the face values live in a work array, so keep a copy
+        m = (vert, face, numpy.array(cmap.get_array()), col, factor)
+        if key is not None:
+            self.mesh_cache[key] = m
+        return m
+
     def draw_one(self, title, Lx, Ly, Lz, X, Y, Z, f, iso,
-                 elev=None, azim=None):
+                 elev=None, azim=None, key=None, budget=None):
         """ Draw a single plot
                 title: title of the plot
                 X, Y, Z: 1D axes data
                 f: 3D data set (C style index?!)
+                key: description of f for the mesh cache (optional)
+                budget: number of triangles for a coarse mesh (optional)
+            The number of triangles, the downsampling factor and the
+            drawing time are kept in self.stats.
         """
+        t0 = time.time()
         self.clf()
-        vert, face = measure.marching_cubes(f, iso)
-        self.rescale(vert, X, Y, Z, f.shape)
+        vert, face, dS, col, factor = self.mesh(f, iso, X, Y, Z, key,
+                                                budget)
         self.ax = self.add_subplot(111, projection='3d')
-        cmap, col = self.getcolor(vert, face)
+        cmap = ScalarMappable(cmap='jet')
+        cmap.set_array(dS)
         surface = Poly3DCollection(vert[face])
         surface.set_color(col)
         surface.set_edgecolor('')
@@ -81,6 +128,7 @@ class Figure3D(Figure):
         self.colorbar(cmap, shrink=0.8, fraction=0.1, label=r'V $^2$')
         self.tight_layout()
         self.canvas.draw()
+        self.stats = (len(face), factor, time.time() - t0)
 
 
 class Figure2D(Figure):
@@ -0,0 +1,155 @@
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Distribution batch
+------------------
+"""
+
+
+import os
+import numpy
+from multiprocessing import Pool
+from DistNASA import DistNASA
+
+
+def bin_dtype(nss):
+    """
+    Columns describing the spatial bin of a distribution file
+    """
+    return [('fname', 'S256'),
+            ('xc', 'f4'), ('zc', 'f4'),
+            ('xlo', 'f4'), ('xhi', 'f4'), ('zlo', 'f4'), ('zhi', 'f4'),
+            ('ic', 'i4', (nss,))]
+
+
+def moments_dtype(nss):
+    """
+    Columns of a table of species moments (see DistNASA.moments)
+    """
+    return numpy.dtype(bin_dtype(nss) + [
+        ('n', 'f8', (nss,)),
+        ('u', 'f8', (nss, 3)),
+        ('P', 'f8', (nss, 3, 3)),
+        ('T', 'f8', (nss, 3, 3)),
+        ('q', 'f8', (nss, 3))])
+
+
+def moments_row(dist, mass=None):
+    """
+    One row of the moments table for a loaded distribution
+    mass: list of species masses (default: 1)
+    """
+    row = numpy.zeros(1, moments_dtype(dist.nss))
+    for s in range(dist.nss):
+        m = dist.moments(s, 1. if mass is None else mass[s])
+        for k in ['n', 'u', 'P', 'T', 'q']:
+            row[k][0, s] = m[k]
+    return row
+
+
+def non_maxwellian_dtype(nss):
+    """
+    Columns of a table of non-Maxwellian measures
+    (see DistNASA.non_maxwellian)
+    """
+    return numpy.dtype(bin_dtype(nss) + [
+        ('entropy', 'f8', (nss,)),
+        ('epsilon', 'f8', (nss,))])
+
+
+def non_maxwellian_row(dist):
+    """
+    One row of the non-Maxwellian table for a loaded distribution
+    """
+    row = numpy.zeros(1, non_maxwellian_dtype(dist.nss))
+    for s in range(dist.nss):
+        m = dist.non_maxwellian(s)
+        row['entropy'][0, s] = m['entropy']
+        row['epsilon'][0, s] = m['epsilon']
+    return row
+
+
+def _process(args):
+    """
+    Load one file in a worker and turn it into a table row.
+    Files that are not distributions of this grid (size or record
+    marker) are returned without a row.
+    """
+    func, fname, grid, nss, kwargs = args
+    try:
+        DistNASA.header(fname, grid, nss)
+        dist = DistNASA(fname, grid, nss)
+    except (IOError, ValueError, IndexError):
+        return fname, None
+    row = func(dist, **kwargs)
+    row['fname'] = os.path.basename(fname)
+    for k in ['xlo', 'xhi', 'zlo', 'zhi', 'ic']:
+        row[k] = dist.data[k]
+    row['xc'] = (dist.data['xlo'] + dist.data['xhi']) / 2.
+    row['zc'] = (dist.data['zlo'] + dist.data['zhi']) / 2.
+    return fname, row
+
+
+class DistBatch:
+
+    """
+    This class runs a per-file computation over the distribution files of
+    a run in a process pool and streams the rows to disk.
+    Each worker holds one file at a time and is replaced after
+    maxtasksperchild files, which bounds its memory.
+    """
+
+    def __init__(self, files, grid=101, nss=4):
+        """
+        files: list of distribution filenames
+        grid: number of grid points
+        nss: number of species
+        """
+        self.files = list(files)
+        self.grid = grid
+        self.nss = nss
+        self.failed = []
+
+    def run(self, out, func=moments_row, dtype=None, processes=None,
+            maxtasksperchild=8, **kwargs):
+        """
+        Compute func(dist, **kwargs) for every file and save the rows,
+        sorted by bin centre (zc, xc), as the columns of out (.npz).
+        Rows are appended to out + '.part' as they arrive.
+        Files that cannot be read are listed in self.failed.
+        """
+        if dtype is None:
+            dtype = moments_dtype(self.nss)
+        part = out + '.part'
+        self.failed = []
+        tasks = [(func, f, self.grid, self.nss, kwargs) for f in self.files]
+        pool = Pool(processes, maxtasksperchild=maxtasksperchild)
+        fh = open(part, 'wb')
+        try:
+            for fname, row in pool.imap_unordered(_process, tasks):
+                if row is None:
+                    self.failed.append(fname)
+                else:
+                    row.astype(dtype).tofile(fh)
+                    fh.flush()
+        finally:
+            fh.close()
+            pool.close()
+            pool.join()
+        table = numpy.fromfile(part, dtype)
+        table = table[numpy.lexsort((table['xc'], table['zc']))]
+        numpy.savez(out, **dict((k, table[k]) for k in dtype.names))
+        os.remove(part)
+        return table
@@ -0,0 +1,145 @@
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Distribution catalog
+--------------------
+"""
+
+
+import os
+import numpy
+from DistNASA import DistNASA
+from DistBatch import bin_dtype
+
+
+class DistCatalog:
+
+    """
+    This class indexes the distribution files of a directory by their
+    spatial bins. Only the file headers are read, and the index is saved
+    in the directory, so that later catalogs only stat the files.
+    """
+    index_name = 'dist_catalog.npz'
+
+    def __init__(self, path, grid=101, nss=4):
+        """
+        path: directory of distribution files
+        grid: number of grid points
+        nss: number of species
+        """
+        self.path = path
+        self.grid = grid
+        self.nss = nss
+        self.dtype = numpy.dtype(bin_dtype(nss) + [
+            ('vmin', 'f4', (nss,)), ('vmax', 'f4', (nss,)),
+            ('mtime', 'f8'), ('size', 'i8')])
+        self.index = os.path.join(path, self.index_name)
+        self.table = self.load()
+        if self.table is None:
+            self.table = self.scan()
+            self.save()
+
+    def __len__(self):
+        return len(self.table)
+
+    def files(self):
+        """
+        Candidate files: regular files of the right size
+        """
+        size = DistNASA.datatype(self.grid, self.nss).itemsize
+        flist = []
+        for f in sorted(os.listdir(self.path)):
+            st = os.stat(os.path.join(self.path, f))
+            if os.path.isfile(os.path.join(self.path, f)) and \
+                    st.st_size == size:
+                flist.append((f, st.st_mtime, st.st_size))
+        return flist
+
+    def scan(self):
+        """
+        Read the header of every candidate file
+        """
+        rows = []
+        for f, mtime, size in self.files():
+            try:
+                head = DistNASA.header(os.path.join(self.path, f),
+                                       self.grid, self.nss)
+            except (IOError, ValueError):
+                continue
+            row = numpy.zeros(1, self.dtype)
+            row['fname'] = f
+            for k in ['xlo', 'xhi', 'zlo', 'zhi', 'ic']:
+                row[k] = head[k]
+            row['xc'] = (head['xlo'] + head['xhi']) / 2.
+            row['zc'] = (head['zlo'] + head['zhi']) / 2.
+            row['vmin'] = head['axes'][:, 0]
+            row['vmax'] = head['axes'][:, -1]
+            row['mtime'] = mtime
+            row['size'] = size
+            rows.append(row)
+        if not rows:
+            return numpy.zeros(0, self.dtype)
+        return numpy.concatenate(rows)
+
+    def load(self):
+        """
+        Load the saved index if it matches the files in the directory
+        """
+        if not os.path.isfile(self.index):
+            return None
+        try:
+            saved = numpy.load(self.index)
+            table = saved['table']
+            saved.close()
+        except (IOError, ValueError, KeyError):
+            return None
+        if table.dtype != self.dtype:
+            return None
+        # every saved file must be unchanged, and no file may be new
+        current = dict((f, (t, s)) for f, t, s in self.files())
+        for row in table:
+            if current.pop(row['fname'], None) != (row['mtime'], row['size']):
+                return None
+        if current:
+            return None
+        return table
+
+    def save(self):
+        try:
+            numpy.savez(self.index, table=self.table)
+        except IOError:
+            # a read-only data directory only costs a rescan next time
+            pass
+
+    def fullpath(self, rows):
+        return [os.path.join(self.path, f) for f in rows['fname']]
+
+    def find(self, x, z):
+        """
+        Files whose bin contains the point (x, z)
+        """
+        t = self.table
+        hit = (t['xlo'] <= x) & (x <= t['xhi']) & \
+            (t['zlo'] <= z) & (z <= t['zhi'])
+        return self.fullpath(t[hit])
+
+    def box(self, xmin, xmax, zmin, zmax):
+        """
+        Files whose bin overlaps the box [xmin,xmax] x [zmin,zmax]
+        """
+        t = self.table
+        hit = (t['xlo'] <= xmax) & (xmin <= t['xhi']) & \
+            (t['zlo'] <= zmax) & (zmin <= t['zhi'])
+        return self.fullpath(t[hit])
@@ -18,7 +18,10 @@ Distribution
 """
 
 
+import os
 import numpy
+from Trilinear import Trilinear, fractional_index
+from SnapshotCache import LRUCache
 
 
 class DistNASA:
@@ -26,7 +29,26 @@ class DistNASA:
     This class is used to store data in ndarray from a NASA PIC data file.
     Methods for data slicing and summation are provided.
     """
-    data_t = {}
+    # axis of fxyz summed over by a cut in each direction
+    cut_axis = {'x': 3, 'y': 2, 'z': 1}
+    # number of cuts and species sums kept for repeated requests
+    cut_cache_size = 32
+    sum_cache_size = 32
+    # velocities and cell widths of each axes grid
+    weights = {}
+    # interpolation matrices per pair of axes
+    regrid_cache = LRUCache(64)
+    # gyrotropic resampling weights per axes grid and B direction;
+    # an entry is about 20 MB at the default resolution of a 101 grid
+    gyro_weights = LRUCache(64, budget=2 ** 28)
+    # plane sampling weights per grid shape, plane and thickness;
+    # an entry grows with the thickness (about 26 MB for 21 planes of
+    # a 101 grid)
+    plane_weights = LRUCache(64, budget=2 ** 28)
+    # speed bin index of each cell per axes grid and binning
+    # (about 10 MB per entry on a 101 grid)
+    speed_bins = LRUCache(64, budget=2 ** 28)
+
     def __init__(self, fname, grid, nss=4):
         """
         fname: data filename
@@ -35,11 +57,32 @@ class DistNASA:
         """
         self.grid = grid
         self.nss = nss
-        datatype = numpy.dtype([
+        datatype = self.datatype(grid, nss)
+        self.data = numpy.fromfile(fname, datatype)[0]
+        self.cuts = LRUCache(self.cut_cache_size)
+        self.sums = LRUCache(self.sum_cache_size)
+        self.cut_key = None
+        self.cut_index = None
+        self.truncate([0, grid])
+
+    @staticmethod
+    def header_dtype(grid, nss=4):
+        """
+        The leading part of a data file: axes, bin location and counts
+        """
+        return numpy.dtype([
                 ('pad1', 'i4'),
                 ('axes', 'f4', (nss, grid)),
                 ('xlo', 'f4'), ('xhi', 'f4'), ('zlo', 'f4'), ('zhi', 'f4'),
-                ('ic', 'i4', (nss,)),
+                ('ic', 'i4', (nss,))
+                ])
+
+    @classmethod
+    def datatype(cls, grid, nss=4):
+        """
+        The structured dtype of a data file
+        """
+        return numpy.dtype(cls.header_dtype(grid, nss).descr + [
                 ('fxyz', 'f4', (nss, grid, grid, grid)),
                 ('fxy', 'f4', (nss, grid, grid)),
                 ('fxz', 'f4', (nss, grid, grid)),
@@ -49,8 +92,20 @@ class DistNASA:
                 ('vza', 'f4', (nss,)),
                 ('pad2', 'i4')
                 ])
-        self.data = numpy.fromfile(fname, datatype)[0]
-        self.truncate([0, grid])
+
+    @classmethod
+    def header(cls, fname, grid, nss=4):
+        """
+        Read only the header of a data file, after checking its size
+        and leading record marker
+        """
+        size = cls.datatype(grid, nss).itemsize
+        if os.path.getsize(fname) != size:
+            raise ValueError(fname + ': file size does not match the grid')
+        head = numpy.fromfile(fname, cls.header_dtype(grid, nss), count=1)[0]
+        if head['pad1'] != size - 8:
+            raise ValueError(fname + ': bad Fortran record marker')
+        return head
 
     def __getitem__(self, key):
         return self.data_t[key]
@@ -77,6 +132,8 @@ class DistNASA:
         """
         b = r[0]
         e = r[1]
+        self.r = (b, e)
+        self.data_t = {}
         for k in ['fxy', 'fxz', 'fyz']:
             self.data_t[k] = self.data[k][:, b:e, b:e]
         self.data_t['fxyz'] = self.data['fxyz'][:, b:e, b:e, b:e]
@@ -88,66 +145,423 @@ class DistNASA:
 
     def cut(self, p):
         """
-        Cut out a 2D slice from the 3D data
+        Cut out a 2D slice from the 3D data by summing the planes
+        rmin..rmax along dir. The loaded data is not modified, and the
+        result is kept for repeated cuts of the same truncation.
         p = [dir,rmin,rmax]
         """
+        if p[0] not in self.cut_axis:
+            raise IndexError
         rmin = int(p[1])
-        rmax = int(p[2])
-        A = self['fxyz']
-        if p[0] == 'x':
-            self.dataCUT = A[:,:,:, rmin]
-            for i in range(rmin+1, rmax+1):
-                self.dataCUT += A[:,:,:, i]
-        elif p[0] == 'y':
-            self.dataCUT = A[:,:, rmin,:]
-            for i in range(rmin+1, rmax+1):
-                self.dataCUT += A[:,:, i,:]
-        elif p[0] == 'z':
-            self.dataCUT = A[:, rmin,:,:]
-            for i in range(rmin+1, rmax+1):
-                self.dataCUT += A[:, i,:,:]
+        rmax = max(int(p[2]), rmin)
+        key = (p[0], rmin, rmax, self.r)
+        if key in self.cuts:
+            self.dataCUT = self.cuts[key]
+        elif self.cut_index is not None:
+            self.dataCUT = self._cut_from_index(p[0], rmin, rmax)
+            self.cuts[key] = self.dataCUT
         else:
-            raise IndexError
-        self.data['cut'] = self.dataCUT
+            axis = self.cut_axis[p[0]]
+            s = [slice(None)] * 4
+            s[axis] = slice(rmin, rmax + 1)
+            self.dataCUT = numpy.add.reduce(self['fxyz'][tuple(s)], axis=axis)
+            self.cuts[key] = self.dataCUT
+        self.cut_key = key
+        self.data_t['cut'] = self.dataCUT
 
-    def _check_add(self, sps):
-        # Check the ranges of velocities are consistent.
-        allowed_error = [1.e-6] * self.grid
-        self.axes = self['axes'][int(sps[0])]
+    def index_cuts(self, on=True):
+        """
+        Use cumulative sums of fxyz along each cut direction, so that any
+        cut is the difference of two planes, no matter how thick it is.
+        The sums are built for the whole data on the first cut in each
+        direction and kept until the object is released.
+        """
+        if not on:
+            self.cut_index = None
+        elif self.cut_index is None:
+            self.cut_index = {}
+
+    def _cut_from_index(self, d, rmin, rmax):
+        """
+        Sum the planes rmin..rmax of the truncated fxyz along d from the
+        cumulative sums
+        """
+        axis = self.cut_axis[d]
+        if d not in self.cut_index:
+            A = self.data['fxyz']
+            shape = list(A.shape)
+            shape[axis] += 1
+            C = numpy.zeros(shape)
+            s = [slice(None)] * 4
+            s[axis] = slice(1, None)
+            numpy.cumsum(A, axis=axis, out=C[tuple(s)])
+            self.cut_index[d] = C
+        C = self.cut_index[d]
+        b, e = self.r
+        hi = min(b + rmax + 1, e)
+        lo = min(b + rmin, hi)
+        A = C.take(hi, axis=axis) - C.take(lo, axis=axis)
+        return A[:, b:e, b:e].astype('f4')
+
+    def same_axes(self, sps):
+        """
+        Whether the species sps have the same velocity axes
+        """
+        axes = self['axes'][int(sps[0])]
         for s in sps[1:]:
-            diff = self['axes'][int(s)] - self.axes
-            if numpy.any(diff > allowed_error):
-                print addset, ' cannot be combined!!!'
-                raise IndexError
+            diff = self['axes'][int(s)] - axes
+            if numpy.any(numpy.abs(diff) > 1.e-6):
+                return False
+        return True
+
+    def common_axes(self, sps):
+        """
+        The axes the species sps are combined on: their own axes if they
+        agree, otherwise the axes with the widest range
+        """
+        sps = [int(s) for s in sps]
+        if self.same_axes(sps):
+            return self['axes'][sps[0]]
+        width = [self['axes'][s][-1] - self['axes'][s][0] for s in sps]
+        return self['axes'][sps[numpy.argmax(width)]]
+
+    def _check_add(self, sps, regrid=False):
+        # Check the ranges of velocities are consistent.
+        if not regrid and not self.same_axes(sps):
+            raise IndexError(str(list(sps)) + ' cannot be combined')
+        self.axes = self.common_axes(sps)
+
+    @classmethod
+    def regrid_weights(cls, old, new):
+        """
+        Linear interpolation matrix from the axes old to the axes new,
+        kept per pair of axes
+        """
+        key = (old.tobytes(), new.tobytes())
+        if key not in cls.regrid_cache:
+            i = fractional_index(old, new)
+            W = numpy.zeros((len(new), len(old)))
+            inside = i >= 0
+            j = numpy.minimum(numpy.floor(i[inside]).astype(int), len(old) - 2)
+            t = i[inside] - j
+            n = numpy.nonzero(inside)[0]
+            W[n, j] = 1 - t
+            W[n, j + 1] = t
+            cls.regrid_cache[key] = W
+        return cls.regrid_cache[key]
+
+    def regrid(self, A, old, new):
+        """
+        Interpolate a 2D or 3D array from the axes old onto the axes new
+        along every dimension, one separable matrix product at a time
+        """
+        if numpy.array_equal(old, new):
+            return A
+        W = self.regrid_weights(old, new)
+        # each product contracts the last axis and puts the new one first
+        for n in range(A.ndim):
+            A = numpy.tensordot(W, A, (1, A.ndim - 1))
+        return A
+
+    def combine(self, key, sps, regrid=False):
+        """
+        Sum self[key] over the species sps into a new array.
+        The source arrays are never modified, and the sums, such as the
+        ions (0,2) and the electrons (1,3), are kept for repeated requests.
+        key: 'fxyz', 'fxy', 'fxz', 'fyz' or 'cut' (the last cut)
+        sps = [s1,s2,...]
+        regrid: species with different axes are interpolated onto
+                common_axes(sps) before they are summed
+        """
+        sps = tuple(int(s) for s in sps)
+        skey = (key, sps, regrid, self.r,
+                self.cut_key if key == 'cut' else None)
+        if skey in self.sums:
+            return self.sums[skey]
+        if regrid and not self.same_axes(sps):
+            axes = self.common_axes(sps)
+            A = 0
+            for s in sps:
+                A = A + self.regrid(self[key][s], self['axes'][s], axes)
+            A = A.astype('f4')
+        else:
+            step = sps[1] - sps[0] if len(sps) > 1 else 1
+            if step > 0 and sps == tuple(range(sps[0], sps[-1] + 1, step)):
+                # evenly spaced species are selected without a copy
+                index = slice(sps[0], sps[-1] + 1, step)
+            else:
+                index = list(sps)
+            A = numpy.add.reduce(self[key][index], axis=0)
+        self.sums[skey] = A
+        return A
 
-    def add2D(self, sps):
+    def add2D(self, sps, regrid=False):
         """
         Combine species for a 2D slice
         sps = [s1,s2,...]
         """
-        self._check_add(sps)
-        self.data2D = self.dataCUT[int(sps[0])]
-        for s in sps[1:]:
-            self.data2D += self.dataCUT[int(s)]
+        self._check_add(sps, regrid)
+        self.data2D = self.combine('cut', sps, regrid)
 
-    def add_reduced(self, sps):
+    def add_reduced(self, sps, regrid=False):
         """
         Combine species for reduced data sets
         sps = [s1,s2,...]
         """
-        self._check_add(sps)
+        self._check_add(sps, regrid)
         self.dataR = {}
         for f in ['fxy', 'fxz', 'fyz']:
-            self.dataR[f] = self[f][int(sps[0])]
-            for s in sps[1:]:
-                self.dataR[f] += self[f][int(s)]
+            self.dataR[f] = self.combine(f, sps, regrid)
 
-    def add3D(self, sps):
+    def add3D(self, sps, regrid=False):
         """
         Combine species for 3D data
         sps = [s1,s2,...]
         """
-        self._check_add(sps)
-        self.data3D = self['fxyz'][int(sps[0])]
-        for s in sps[1:]:
-            self.data3D += self['fxyz'][int(s)]
+        self._check_add(sps, regrid)
+        self.data3D = self.combine('fxyz', sps, regrid)
+
+    @classmethod
+    def velocity_weights(cls, axes):
+        """
+        Velocities and cell widths of an axes grid, computed once per grid
+        """
+        key = axes.tobytes()
+        if key not in cls.weights:
+            v = numpy.array(axes, 'f8')
+            dv = numpy.gradient(v) if len(v) > 1 else numpy.ones(1)
+            cls.weights[key] = (v, dv)
+        return cls.weights[key]
+
+    def _species_fxyz(self, species):
+        """
+        The species whose axes apply and fxyz of a species, or the sum
+        over a list of species with the same axes
+        """
+        if numpy.ndim(species) == 0:
+            s = int(species)
+            return s, self['fxyz'][s]
+        self._check_add(species)
+        return int(species[0]), self.combine('fxyz', species)
+
+    def moments(self, species, mass=1.):
+        """
+        Velocity moments of fxyz for a species (or a list of species with
+        the same axes), where f is taken as a phase space density:
+            n: density
+            u: bulk velocity (ux, uy, uz)
+            P: pressure tensor, m <w_i w_j> with w = v - u
+            T: temperature tensor, P / n
+            q: heat flux vector, m/2 <|w|^2 w_i>
+        Every moment is reduced from the 2D marginals of f.
+        """
+        s, f = self._species_fxyz(species)
+        return self._moments(f, self['axes'][s], mass)
+
+    def _moments(self, f, axes, mass=1.):
+        """
+        Moments of a 3D distribution f on axes (see moments)
+        """
+        v, dv = self.velocity_weights(axes)
+        # F[i, j]: f integrated over the third axis (0: x, 1: y, 2: z),
+        # indexed [v_i, v_j]; fxyz is indexed [z, y, x].
+        F = {}
+        F[1, 0] = numpy.tensordot(dv, f, (0, 0))
+        F[2, 0] = numpy.tensordot(f, dv, (1, 0))
+        F[2, 1] = numpy.tensordot(f, dv, (2, 0))
+        for i, j in list(F):
+            F[j, i] = F[i, j].T
+        F1 = [dv.dot(F[1, 0]), F[1, 0].dot(dv), F[2, 0].dot(dv)]
+        n = F1[0].dot(dv)
+        u = numpy.array([F1[i].dot(v * dv) for i in range(3)]) / n
+        w = [v - u[i] for i in range(3)]
+        P = numpy.empty((3, 3))
+        q = numpy.empty(3)
+        for i in range(3):
+            P[i, i] = F1[i].dot(w[i] ** 2 * dv)
+            q[i] = F1[i].dot(w[i] ** 3 * dv)
+            for j in range(3):
+                if j != i:
+                    P[i, j] = (w[i] * dv).dot(F[i, j]).dot(w[j] * dv)
+                    q[i] += (w[j] ** 2 * dv).dot(F[j, i]).dot(w[i] * dv)
+        P *= mass
+        q *= mass / 2.
+        return {'n': n, 'u': u, 'P': P, 'T': P / n, 'q': q}
+
+    @staticmethod
+    def perpendicular(b):
+        """
+        Two unit vectors perpendicular to b (and to each other)
+        """
+        b = numpy.asarray(b, 'f8')
+        b = b / numpy.sqrt(b.dot(b))
+        e1 = numpy.cross(b, numpy.eye(3)[numpy.abs(b).argmin()])
+        e1 /= numpy.sqrt(e1.dot(e1))
+        return e1, numpy.cross(b, e1)
+
+    @classmethod
+    def field_plane(cls, B, E=None):
+        """
+        Unit vectors spanning the plane perpendicular to B, or, if E is
+        given, the plane containing B and E x B
+        """
+        if E is None:
+            return cls.perpendicular(B)
+        b = numpy.asarray(B, 'f8')
+        b = b / numpy.sqrt(b.dot(b))
+        ExB = numpy.cross(E, b)
+        return b, ExB / numpy.sqrt(ExB.dot(ExB))
+
+    def slice_plane(self, e1, e2, n=None, thickness=1):
+        """
+        Sample fxyz on a plane through the centre of the velocity grid,
+        spanned by e1 and e2 (in the (vx, vy, vz) frame), for all
+        species in one pass.
+        n: number of points along each direction (default: grid size)
+        thickness: number of planes, one grid cell apart along the
+                   normal, that are summed (as in cut)
+        Returns the coordinates along e1 and e2 of each species, shape
+        (nss, n), and f indexed [species, e2, e1].
+        The axes are assumed to be uniform and the same in x, y and z.
+        """
+        f = self['fxyz']
+        shape = f.shape[1:]
+        g = shape[0]
+        if n is None:
+            n = g
+        e1 = numpy.asarray(e1, 'f8')
+        e1 = e1 / numpy.sqrt(e1.dot(e1))
+        e2 = numpy.asarray(e2, 'f8') - e1.dot(e2) * e1
+        e2 = e2 / numpy.sqrt(e2.dot(e2))
+        h = (g - 1) / 2.
+        s = numpy.linspace(-h, h, n)
+        key = (shape, tuple(numpy.round(e1, 6)), tuple(numpy.round(e2, 6)),
+               n, thickness)
+        if key in self.plane_weights:
+            T = self.plane_weights[key]
+        else:
+            normal = numpy.cross(e1, e2)
+            w = numpy.arange(thickness) - (thickness - 1) / 2.
+            # fractional indices [component, e2, e1, thickness]
+            p = h + e1[:, None, None, None] * s[None, None, :, None] + \
+                e2[:, None, None, None] * s[None, :, None, None] + \
+                normal[:, None, None, None] * w
+            # fxyz is indexed [z, y, x]
+            T = Trilinear(shape, p[::-1])
+            self.plane_weights[key] = T
+        axes = self['axes']
+        dv = (axes[:, -1] - axes[:, 0]) / (g - 1.)
+        X = (axes[:, -1] + axes[:, 0])[:, None] / 2. + dv[:, None] * s
+        return X, T(f).sum(axis=-1)
+
+    def local_B(self, field):
+        """
+        Magnetic field of a FieldNASA averaged over the bin of this data
+        """
+        r = [self.data[k] for k in ['xlo', 'xhi', 'zlo', 'zhi']]
+        return numpy.array([field.bin_average(k, *r)
+                            for k in ['Bx', 'By', 'Bz']])
+
+    def gyrotropic(self, species, B, npar=None, nperp=None, nphi=32):
+        """
+        Resample fxyz onto a (v_par, v_perp) grid by averaging trilinear
+        samples over nphi gyrophases around B.
+        species: a species, or a list of species with the same axes
+        B: magnetic field vector, or a FieldNASA to average it from
+        Returns v_par, v_perp and f indexed [v_perp, v_par].
+        The weights of recent axes grids and B directions are kept
+        (within the byte budget of gyro_weights), so species with the same
+        axes, or bins with the same B, reuse them.
+        """
+        s, f = self._species_fxyz(species)
+        if not numpy.ndim(B):
+            B = self.local_B(B)
+        b = numpy.asarray(B, 'f8')
+        b = b / numpy.sqrt(b.dot(b))
+        axes = self['axes'][s]
+        if npar is None:
+            npar = len(axes)
+        if nperp is None:
+            nperp = len(axes) // 2 + 1
+        key = (axes.tobytes(), tuple(numpy.round(b, 6)), npar, nperp, nphi)
+        if key in self.gyro_weights:
+            vpar, vperp, T = self.gyro_weights[key]
+        else:
+            vmax = max(abs(axes[0]), abs(axes[-1]))
+            vpar = numpy.linspace(-vmax, vmax, npar)
+            vperp = numpy.linspace(0, vmax, nperp)
+            e1, e2 = self.perpendicular(b)
+            phi = numpy.arange(nphi) * 2 * numpy.pi / nphi
+            c = numpy.cos(phi)
+            d = numpy.sin(phi)
+            # velocities indexed [component, v_perp, v_par, phi]
+            v = b[:, None, None, None] * vpar[None, None, :, None] + \
+                vperp[None, :, None, None] * \
+                (e1[:, None, None, None] * c + e2[:, None, None, None] * d)
+            # fxyz is indexed [z, y, x]
+            T = Trilinear(f.shape, [fractional_index(axes, v[i])
+                                    for i in (2, 1, 0)])
+            self.gyro_weights[key] = (vpar, vperp, T)
+        return vpar, vperp, T(f).mean(axis=-1)
+
+    def energy_spectrum(self, species, nbins=50, mass=None):
+        """
+        Bin f dV of fxyz by speed |v|, or by energy m |v|^2 / 2 if the
+        species mass is given, with numpy.bincount.
+        species: a species, or a list of species with the same axes
+        Returns the bin edges and the spectrum (f dV summed in each bin).
+        The flattened bin index of the cells is kept per axes grid, so
+        every file and species sharing the grid reuses it.
+        """
+        s, f = self._species_fxyz(species)
+        axes = self['axes'][s]
+        key = (axes.tobytes(), nbins)
+        if key in self.speed_bins:
+            edges, index, dV = self.speed_bins[key]
+        else:
+            v, dv = self.velocity_weights(axes)
+            # |v| of the cells of fxyz, indexed [z, y, x]
+            speed = numpy.sqrt(v[:, None, None] ** 2 + v[None, :, None] ** 2
+                               + v[None, None, :] ** 2).ravel()
+            edges = numpy.linspace(0, speed.max(), nbins + 1)
+            index = numpy.clip(numpy.searchsorted(edges, speed, 'right') - 1,
+                               0, nbins - 1)
+            index = index.astype('u2' if nbins < 2 ** 16 else 'i4')
+            dV = (dv[:, None, None] * dv[None, :, None] *
+                  dv[None, None, :]).ravel()
+            self.speed_bins[key] = (edges, index, dV)
+        spectrum = numpy.bincount(index, f.ravel() * dV, nbins)
+        if mass is not None:
+            return mass * edges ** 2 / 2., spectrum
+        return edges, spectrum
+
+    def non_maxwellian(self, species):
+        """
+        Compare fxyz of a species with its moment-equivalent Maxwellian
+        f_M (same n, u and scalar temperature):
+            entropy: relative kinetic entropy per particle,
+                     sum f ln(f / f_M) dV / n
+            epsilon: relative L2 distance,
+                     sqrt(sum (f - f_M)^2 dV / sum f_M^2 dV)
+        species: a species, or a list of species with the same axes
+        """
+        s, f = self._species_fxyz(species)
+        axes = self['axes'][s]
+        m = self._moments(f, axes)
+        n = m['n']
+        # thermal speed squared T/m
+        vt2 = numpy.trace(m['T']) / 3.
+        v, dv = self.velocity_weights(axes)
+        # separable factors of f_M along z, y and x (fxyz is [z, y, x])
+        g = [numpy.exp(-(v - m['u'][i]) ** 2 / (2 * vt2)) for i in range(3)]
+        fM = n / (2 * numpy.pi * vt2) ** 1.5 * \
+            g[2][:, None, None] * g[1][None, :, None] * g[0][None, None, :]
+        dV = dv[:, None, None] * dv[None, :, None] * dv[None, None, :]
+        f = numpy.asarray(f, 'f8')
+        pos = f > 0
+        tiny = numpy.finfo('f8').tiny
+        entropy = (f[pos] * numpy.log(f[pos] / numpy.maximum(fM[pos], tiny))
+                   * dV[pos]).sum() / n
+        epsilon = numpy.sqrt(((f - fM) ** 2 * dV).sum() /
+                             (fM ** 2 * dV).sum())
+        return {'entropy': entropy, 'epsilon': epsilon}
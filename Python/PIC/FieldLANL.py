@@ -18,8 +18,10 @@ Field
 """
 
 
+import os
 import numpy
 import struct
+from multiprocessing.pool import ThreadPool
 
 
 class FieldLANL:
@@ -28,27 +30,85 @@ class FieldLANL:
     This class is used to store data in ndarray from LANL PIC data files.
     """
 
-    def __init__(self, datafiles, grid, time):
+    def __init__(self, datafiles, grid, time, max_workers=1):
         """
         datafiles: dict of full filenames
         grid: numbers of grid points
+        time: time slice (starting from 1)
+        max_workers: number of threads reading the component files
         """
-        nx = grid[0]
-        nz = grid[2]
-        self.data = {}
-        skip = (nx * nz + 2) * 4 * (time - 1)
-        datatype = numpy.dtype([('field', 'f4', (nz, nx))])
-        for k in datafiles:
+        self.datafiles = datafiles
+        self.grid = grid
+        keys = list(datafiles)
+        for k in keys:
             print 'Reading ' + datafiles[k] + ' ...'
-            f = open(datafiles[k])
-            f.seek(skip)
-            self.data[k] = (numpy.fromfile(f, datatype))[0][0]
-            f.close()
+        if max_workers > 1 and len(keys) > 1:
+            # numpy releases the GIL while reading the files
+            pool = ThreadPool(min(max_workers, len(keys)))
+            try:
+                data = pool.map(
+                    lambda k: self.read_slice(datafiles[k], grid, time),
+                    keys)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            data = [self.read_slice(datafiles[k], grid, time) for k in keys]
+        self.data = dict(zip(keys, data))
 
     def __getitem__(self, key):
         return self.data[key]
 
+    @staticmethod
+    def stride(grid):
+        """
+        Number of bytes of one time slice
+        """
+        return (grid[0] * grid[2] + 2) * 4
+
+    @staticmethod
+    def read_slice(fname, grid, time):
+        """
+        Read only one time slice (starting from 1) of a component file
+        """
+        nx = grid[0]
+        nz = grid[2]
+        f = open(fname, 'rb')
+        f.seek(FieldLANL.stride(grid) * (time - 1))
+        data = numpy.fromfile(f, 'f4', count=nx * nz)
+        f.close()
+        if data.size != nx * nz:
+            raise IndexError(fname + ': no time slice ' + str(time))
+        return data.reshape(nz, nx)
+
+    @staticmethod
+    def map_slices(fname, grid):
+        """
+        Memory-map all time slices of a component file as a (nt, nz, nx)
+        array; only the slices that are indexed are read.
+        """
+        nx = grid[0]
+        nz = grid[2]
+        stride = FieldLANL.stride(grid)
+        datatype = numpy.dtype([('field', 'f4', (nz, nx)),
+                                ('pad', 'i4', (2,))])
+        nt = os.path.getsize(fname) // stride
+        if nt == 0:
+            return numpy.empty((0, nz, nx), 'f4')
+        return numpy.memmap(fname, datatype, mode='r', shape=(nt,))['field']
+
+    def series(self, key):
+        """
+        All time slices of a component: series(key)[time - 1] is the
+        time slice this object would read for that time.
+        """
+        return self.map_slices(self.datafiles[key], self.grid)
+
+    @staticmethod
     def read_from_info(info_file):
+        """
+        Read the numbers of grid points and the box lengths from an info file
+        """
         grid = []
         L = []
         f = open(info_file, 'rb')
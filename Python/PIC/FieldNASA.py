@@ -18,6 +18,7 @@ Field
 """
 
 
+import os
 import numpy
 
 
@@ -30,21 +31,57 @@ class FieldNASA:
                 'pxx', 'pyy', 'pzz', 'pxy', 'pxz', 'pyz', 'dns']
     singlelist = ['Bx', 'By', 'Bz', 'Ex', 'Ey', 'Ez']
     fieldlist = singlelist + quadlist
-    data_t = {}
+    metalist = ['xe', 'ze', 'mass', 'q', 'time', 'wpewce', 'dfac']
 
-    def __init__(self, fname, nss=4):
+    header_dtype = numpy.dtype([
+        ('pad1', 'i4'), ('it', 'i4'), ('dt', 'f4'), ('teti', 'f4'),
+        ('xmax', 'f4'), ('zmax', 'f4'), ('nnx', 'i4'), ('nnz', 'i4')
+    ])
+
+    def __init__(self, fname, nss=4, mmap=False, fields=None,
+                 lazy_dfac=None):
         """ fname: PIC field data filename
+            nss: number of species
+            mmap: map the file into memory instead of reading all of it,
+                  so that only the arrays actually used are paged in
+            fields: names of the fields to read (default: all of them);
+                    'singlelist', 'quadlist' and 'fieldlist' name groups
+            lazy_dfac: apply the dfac normalization of the quad moments
+                       on access instead of scaling all of them on load
+                       (default: same as mmap, since scaling on load
+                       would page in and copy every quad array)
         """
-        datatype = numpy.dtype([
-            ('pad1', 'i4'), ('it', 'i4'), ('dt', 'f4'), ('teti', 'f4'),
-            ('xmax', 'f4'), ('zmax', 'f4'), ('nnx', 'i4'), ('nnz', 'i4')
-        ])
-        data = numpy.fromfile(fname, datatype)[0]
-        nx = data['nnx']
-        nz = data['nnz']
-        datatype = numpy.dtype([
-            ('pad1', 'i4'), ('it', 'i4'), ('dt', 'f4'), ('teti', 'f4'),
-            ('xmax', 'f4'), ('zmax', 'f4'), ('nnx', 'i4'), ('nnz', 'i4'),
+        head = self.header(fname, nss)
+        nx = head['nnx']
+        nz = head['nnz']
+        datatype = self.datatype(nx, nz, nss)
+        self.fields = self.expand_fields(fields)
+        if lazy_dfac is None:
+            lazy_dfac = mmap
+        self.lazy_dfac = lazy_dfac
+        if mmap:
+            # copy-on-write, so that the scaling below never touches the file;
+            # nothing is written to a lazily scaled map, so keep it read-only
+            mode = 'r' if lazy_dfac else 'c'
+            self.data = numpy.memmap(fname, datatype, mode=mode,
+                                     shape=(1,))[0]
+        elif fields is None:
+            self.data = numpy.fromfile(fname, datatype, count=1)[0]
+        else:
+            self.data = self._read_fields(
+                fname, datatype,
+                list(self.header_dtype.names) + self.metalist + self.fields)
+        self.dfac = self.data['dfac'][:, numpy.newaxis, numpy.newaxis]
+        if not lazy_dfac:
+            for k in self.loaded(self.quadlist):
+                self.data[k] *= self.dfac
+        self.truncate([0, nx, 0, nz])
+
+    @classmethod
+    def datatype(cls, nx, nz, nss=4):
+        """ The structured dtype of a field data file with a nx*nz grid
+        """
+        return numpy.dtype(cls.header_dtype.descr + [
             ('vxs', 'f4', (nss, nz, nx)),
             ('vys', 'f4', (nss, nz, nx)),
             ('vzs', 'f4', (nss, nz, nx)),
@@ -70,21 +107,95 @@ class FieldNASA:
             ('pyz', 'f4', (nss, nz, nx)),
             ('pad2', 'i4')
         ])
-        self.data = numpy.fromfile(fname, datatype)[0]
-        for k in self.quadlist:
-            for i in range(4):
-                self.data[k][i] *= self.data['dfac'][i]
-        self.truncate([0, nx, 0, nz])
+
+    @classmethod
+    def header(cls, fname, nss=4):
+        """ Read only the header record of a field data file.
+            The file size and the Fortran record markers (pad1/pad2) are
+            checked against the grid size before any data is touched.
+        """
+        head = numpy.fromfile(fname, cls.header_dtype, count=1)
+        if len(head) != 1:
+            raise ValueError(fname + ': file too short for a header')
+        head = head[0]
+        size = cls.datatype(head['nnx'], head['nnz'], nss).itemsize
+        if os.path.getsize(fname) != size:
+            raise ValueError(fname + ': file size does not match the grid')
+        f = open(fname, 'rb')
+        f.seek(size - 4)
+        pad2 = numpy.fromfile(f, 'i4', count=1)[0]
+        f.close()
+        if head['pad1'] != size - 8 or pad2 != head['pad1']:
+            raise ValueError(fname + ': bad Fortran record markers')
+        return head
+
+    @classmethod
+    def expand_fields(cls, fields):
+        """ Expand group names in a list of fields
+        """
+        if fields is None:
+            return list(cls.fieldlist)
+        groups = {'singlelist': cls.singlelist,
+                  'quadlist': cls.quadlist,
+                  'fieldlist': cls.fieldlist}
+        flist = []
+        for k in fields:
+            for f in groups.get(k, [k]):
+                if f not in cls.fieldlist:
+                    raise KeyError(f)
+                if f not in flist:
+                    flist.append(f)
+        return flist
+
+    def _read_fields(self, fname, datatype, keys):
+        """ Seek to and read only the byte ranges of the given keys
+        """
+        data = {}
+        f = open(fname, 'rb')
+        for k in sorted(keys, key=lambda k: datatype.fields[k][1]):
+            dt, offset = datatype.fields[k][:2]
+            f.seek(offset)
+            data[k] = numpy.fromfile(f, dt, count=1)[0]
+        f.close()
+        return data
+
+    def loaded(self, flist):
+        """ The fields of flist that have been loaded
+        """
+        return [k for k in flist if k in self.fields]
 
     def __getitem__(self, key):
+        if self.lazy_dfac and key in self.quadlist:
+            # scale the truncated view only once per truncation
+            if key not in self.data_s:
+                self.data_s[key] = self.data_t[key] * self.dfac
+            return self.data_s[key]
         return self.data_t[key]
 
     def truncate(self, r):
         """ We do basic slicing here, so that no copies are made.
+            New dicts are made, so that copies of this object sharing
+            the same data can be truncated independently.
         """
-        for k in self.singlelist:
+        self.data_s = {}
+        self.data_t = {}
+        for k in self.loaded(self.singlelist):
             self.data_t[k] = self.data[k][r[2]:r[3], r[0]:r[1]]
-        for k in self.quadlist:
+        for k in self.loaded(self.quadlist):
             self.data_t[k] = self.data[k][:, r[2]:r[3], r[0]:r[1]]
         self.data_t['xe'] = self.data['xe'][r[0]:r[1]]
         self.data_t['ze'] = self.data['ze'][r[2]:r[3]]
+
+    def bin_average(self, key, xlo, xhi, zlo, zhi):
+        """ Average of a single field over the grid points of a bin,
+            or its value at the nearest grid point for a smaller bin
+        """
+        xe = self.data['xe']
+        ze = self.data['ze']
+        ix = numpy.nonzero((xe >= xlo) & (xe <= xhi))[0]
+        iz = numpy.nonzero((ze >= zlo) & (ze <= zhi))[0]
+        if len(ix) == 0:
+            ix = [numpy.abs(xe - (xlo + xhi) / 2.).argmin()]
+        if len(iz) == 0:
+            iz = [numpy.abs(ze - (zlo + zhi) / 2.).argmin()]
+        return self.data[key][iz[0]:iz[-1] + 1, ix[0]:ix[-1] + 1].mean()
@@ -0,0 +1,121 @@
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Field time series
+-----------------
+"""
+
+
+import os
+import glob
+import numpy
+from collections import OrderedDict
+from FieldNASA import FieldNASA
+
+
+class FieldSeries:
+
+    """ This class exposes the fields-NNNNN.dat files of a NASA PIC run
+    as time-indexed virtual arrays.
+    series[key] is a (nt, [nss,] nz, nx) array-like object; indexing it
+    reads only the requested bytes from a memory map of each file.
+    Only the max_maps most recently used files are kept mapped, since
+    every map holds an open file.
+    """
+    max_maps = 64
+
+    def __init__(self, path, nss=4):
+        """ path: run directory with fields-*.dat files
+            nss: number of species
+        """
+        self.files = sorted(glob.glob(os.path.join(path, 'fields-*.dat')))
+        if not self.files:
+            raise IOError(path + ': no fields-*.dat files')
+        self.nss = nss
+        heads = [FieldNASA.header(f, nss) for f in self.files]
+        self.nx = heads[0]['nnx']
+        self.nz = heads[0]['nnz']
+        for f, h in zip(self.files, heads):
+            if h['nnx'] != self.nx or h['nnz'] != self.nz:
+                raise ValueError(f + ': grid differs from ' + self.files[0])
+        self.it = numpy.array([h['it'] for h in heads])
+        self.datatype = FieldNASA.datatype(self.nx, self.nz, nss)
+        self.maps = OrderedDict()
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, key):
+        if key not in FieldNASA.fieldlist + FieldNASA.metalist:
+            raise KeyError(key)
+        return FieldSeriesArray(self, key)
+
+    def snapshot(self, i):
+        """ The memory-mapped record of the i-th file, mapped on first use
+        """
+        if i in self.maps:
+            data = self.maps.pop(i)
+        else:
+            if len(self.maps) >= self.max_maps:
+                self.maps.popitem(last=False)
+            data = numpy.memmap(self.files[i], self.datatype,
+                                mode='r', shape=(1,))[0]
+        self.maps[i] = data
+        return data
+
+
+class FieldSeriesArray:
+
+    """ A lazily evaluated (nt, ...) array of one field of a FieldSeries.
+    The quad moments are scaled by dfac of each file, as in FieldNASA.
+    """
+
+    def __init__(self, series, key):
+        self.series = series
+        self.key = key
+        self.shape = (len(series),) + series.datatype.fields[key][0].shape
+        self.ndim = len(self.shape)
+        self.dtype = series.datatype.fields[key][0].base
+
+    def __len__(self):
+        return self.shape[0]
+
+    def slab(self, i, idx):
+        """ Read field[idx] of the i-th file
+        """
+        data = self.series.snapshot(i)
+        A = data[self.key][idx]
+        if self.key in FieldNASA.quadlist:
+            dfac = data['dfac'][:, numpy.newaxis, numpy.newaxis]
+            A = A * numpy.broadcast_to(dfac, self.shape[1:])[idx]
+        return A
+
+    def __getitem__(self, idx):
+        if not isinstance(idx, tuple):
+            idx = (idx,)
+        t = idx[0]
+        idx = idx[1:]
+        if numpy.ndim(t) == 0 and not isinstance(t, slice):
+            return numpy.array(self.slab(numpy.arange(len(self))[t], idx))
+        tlist = numpy.arange(len(self))[t]
+        # the shape of one slab, without touching any data
+        shape = numpy.broadcast_to(self.dtype.type(0), self.shape[1:])[idx]
+        A = numpy.empty((len(tlist),) + numpy.shape(shape), self.dtype)
+        for n, i in enumerate(tlist):
+            A[n] = self.slab(i, idx)
+        return A
+
+    def __array__(self, dtype=None):
+        return numpy.asarray(self[:], dtype)
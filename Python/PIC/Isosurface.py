@@ -0,0 +1,201 @@
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Isosurface
+----------
+
+This module needs scikit-image, so it is not imported by the PIC package;
+use ``from PIC.Isosurface import marching_cubes``.
+Run it as a script to compare the chunked and the single-call meshing.
+"""
+
+
+import time
+import numpy
+from multiprocessing import Pool, cpu_count
+from skimage import measure
+
+
+def _chunk(args):
+    """
+    Mesh one slab of the volume in a worker.
+    The vertices are shifted by the first plane of the slab.
+    """
+    f, iso, b = args
+    if not f.min() < iso < f.max():
+        return numpy.zeros((0, 3)), numpy.zeros((0, 3), int)
+    vert, face = measure.marching_cubes(f, iso)[:2]
+    vert[:, 0] += b
+    return vert, face
+
+
+def slabs(n, chunks):
+    """
+    First and last planes of chunks slabs along an axis of n planes.
+    Neighbouring slabs share one plane, so that every cell is in
+    exactly one slab.
+    """
+    chunks = max(1, min(chunks, n - 1))
+    edge = numpy.linspace(0, n - 1, chunks + 1).round().astype(int)
+    return zip(edge[:-1], edge[1:])
+
+
+def stitch(meshes, decimals=4):
+    """
+    Join the meshes of the slabs into one. The vertices on the shared
+    planes are computed in both slabs, so vertices that agree to the given
+    decimals (in grid index units) are merged.
+    """
+    vert = numpy.concatenate([v for v, f in meshes])
+    offset = numpy.cumsum([0] + [len(v) for v, f in meshes[:-1]])
+    face = numpy.concatenate([f + o for (v, f), o in zip(meshes, offset)])
+    if not len(vert):
+        return vert, face
+    key = numpy.ascontiguousarray(vert.round(decimals))
+    key = key.view(numpy.dtype((numpy.void, key.dtype.itemsize * 3)))
+    key, first, inverse = numpy.unique(key.ravel(), return_index=True,
+                                       return_inverse=True)
+    return vert[first], inverse.ravel()[face]
+
+
+def marching_cubes(f, iso, processes=1, chunks=None):
+    """
+    Isosurface of the 3D array f at iso: (vertices, faces), with the
+    vertices in grid index units as in skimage.measure.marching_cubes.
+    processes: number of worker processes (None: all cores); with 1 the
+               volume is meshed in a single call
+    chunks: number of slabs along the first axis (default: 2 per process)
+    """
+    if processes is None:
+        processes = cpu_count()
+    if processes == 1 and chunks is None:
+        return measure.marching_cubes(f, iso)[:2]
+    if chunks is None:
+        chunks = 2 * processes
+    tasks = [(numpy.ascontiguousarray(f[b:e + 1]), iso, b)
+             for b, e in slabs(f.shape[0], chunks)]
+    pool = Pool(processes)
+    try:
+        meshes = pool.map(_chunk, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return stitch(meshes)
+
+
+def crossings(f, iso):
+    """
+    Number of grid cells of f that the isosurface at iso passes through
+    """
+    s = f > iso
+    lo = s[:-1, :-1, :-1].copy()
+    hi = lo.copy()
+    for i in (0, 1):
+        for j in (0, 1):
+            for k in (0, 1):
+                c = s[i:s.shape[0] - 1 + i, j:s.shape[1] - 1 + j,
+                      k:s.shape[2] - 1 + k]
+                lo &= c
+                hi |= c
+    return numpy.count_nonzero(hi & ~lo)
+
+
+def lod_factor(f, iso, budget):
+    """
+    Smallest downsampling factor whose mesh is expected to stay within
+    budget triangles. A cell that is cut makes about two triangles, and
+    the number of cut cells drops with the square of the factor.
+    """
+    ntri = 2 * crossings(f, iso)
+    if ntri <= budget:
+        return 1
+    return int(numpy.ceil(numpy.sqrt(ntri / float(budget))))
+
+
+def downsample(f, factor):
+    """
+    Block means of f over factor^3 cells; planes beyond the last full
+    block are dropped
+    """
+    n = [m // factor for m in f.shape]
+    g = f[:n[0] * factor, :n[1] * factor, :n[2] * factor]
+    g = g.reshape(n[0], factor, n[1], factor, n[2], factor)
+    return g.mean(axis=(1, 3, 5))
+
+
+def marching_cubes_lod(f, iso, budget, processes=1):
+    """
+    Isosurface of f at iso within about budget triangles: f is
+    downsampled by lod_factor first. Returns (vertices, faces, factor),
+    with the vertices in grid index units of f.
+    Block means flatten peaks, so the factor is lowered until iso is
+    inside the range of the downsampled volume; if it is not inside the
+    range of f either, the mesh is empty.
+    """
+    factor = lod_factor(f, iso, budget)
+    g = f
+    while factor > 1:
+        g = downsample(f, factor)
+        if g.min() < iso < g.max():
+            break
+        factor -= 1
+    if factor == 1:
+        g = f
+    if not g.min() < iso < g.max():
+        return numpy.zeros((0, 3)), numpy.zeros((0, 3), int), factor
+    vert, face = marching_cubes(g, iso, processes)
+    if factor == 1:
+        return vert, face, factor
+    # block b covers the points b * factor ... b * factor + factor - 1
+    vert = vert * factor + (factor - 1) / 2.
+    return vert, face, factor
+
+
+def benchmark(n=201, processes=None, repeat=3):
+    """
+    Time the single call and the chunked meshing of a shell-like test
+    volume on an n^3 grid
+    """
+    x = numpy.linspace(-1, 1, n)
+    r = numpy.sqrt(x[:, None, None] ** 2 + x[None, :, None] ** 2 +
+                   x[None, None, :] ** 2)
+    f = numpy.exp(-(r - 0.5) ** 2 / 0.02) * \
+        (1 + 0.3 * numpy.cos(6 * x)[:, None, None])
+    f = f.astype('f4')
+    iso = 0.5 * f.max()
+    result = []
+    for p in [1, processes]:
+        t = []
+        for i in range(repeat):
+            t0 = time.time()
+            vert, face = marching_cubes(f, iso, p)
+            t.append(time.time() - t0)
+        result.append((p, min(t), len(vert), len(face)))
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=
+            'Benchmark the chunked parallel marching cubes')
+    parser.add_argument('--grid', default=201,
+            help='number of grid points (default = 201)')
+    parser.add_argument('--procs',
+            help='number of processes (default = all cores)')
+    args = parser.parse_args()
+    procs = int(args.procs) if args.procs else None
+    for p, t, nv, nf in benchmark(int(args.grid), procs):
+        print('processes=%s: %.3f s, %d vertices, %d faces' %
+              (p if p else cpu_count(), t, nv, nf))
@@ -0,0 +1,100 @@
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+LANL run
+--------
+"""
+
+
+import os
+from FieldLANL import FieldLANL
+
+
+class LANLRun:
+
+    """
+    This class describes a LANL PIC run: the info file is parsed once, and
+    the grid, box lengths, slice offsets and numbers of time slices are
+    kept, so that any (component, time) can be viewed without re-reading.
+    """
+
+    def __init__(self, info_file, datafiles):
+        """
+        info_file: full filename of the info file
+        datafiles: dict of full filenames of the component files
+        """
+        self.grid, self.L = FieldLANL.read_from_info(info_file)
+        self.datafiles = dict(datafiles)
+        self.stride = FieldLANL.stride(self.grid)
+        self.nt = {}
+        for k in self.datafiles:
+            self.nt[k] = os.path.getsize(self.datafiles[k]) // self.stride
+        # number of time slices available in all components
+        self.ntime = min(self.nt.values()) if self.nt else 0
+        self.maps = {}
+
+    def __getitem__(self, key):
+        """
+        run[component, time] is a (nz, nx) view of one time slice
+        """
+        k, time = key
+        self._check(k, time)
+        return self.series(k)[time - 1]
+
+    def _check(self, key, time):
+        if time < 1 or time > self.nt[key]:
+            raise IndexError(self.datafiles[key] + ': no time slice '
+                             + str(time))
+
+    def offset(self, time):
+        """
+        Byte offset of a time slice (starting from 1) in a component file
+        """
+        return self.stride * (time - 1)
+
+    def series(self, key):
+        """
+        All time slices of a component, memory-mapped once per run
+        """
+        if key not in self.maps:
+            self.maps[key] = FieldLANL.map_slices(self.datafiles[key],
+                                                  self.grid)
+        return self.maps[key]
+
+    def field(self, time, keys=None):
+        """
+        A FieldLANL-compatible view of a time slice (starting from 1)
+        keys: components to include (default: all)
+        """
+        if keys is None:
+            keys = list(self.datafiles)
+        return LANLView(self, time, keys)
+
+
+class LANLView(FieldLANL):
+
+    """
+    A FieldLANL whose arrays are views into the memory maps of a LANLRun
+    """
+
+    def __init__(self, run, time, keys):
+        self.run = run
+        self.time = time
+        self.grid = run.grid
+        self.datafiles = dict((k, run.datafiles[k]) for k in keys)
+        self.data = dict((k, run[k, time]) for k in keys)
+
+    def series(self, key):
+        return self.run.series(key)
@@ -0,0 +1,214 @@
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cache
+-----
+"""
+
+
+import os
+import copy
+import numpy
+from collections import OrderedDict
+
+
+class SnapshotCache:
+
+    """
+    This class keeps recently loaded PIC data objects in memory.
+    Entries are keyed by the class, the file path, its mtime and size and
+    the loading arguments, and are evicted in LRU order once the total
+    size exceeds the memory budget or there are more than max_entries.
+    Memory-mapped data does not count against the budget, but every map
+    holds an open file, so the entry count is capped as well.
+    """
+
+    def __init__(self, budget=2 ** 30, max_entries=64):
+        """
+        budget: memory budget in bytes
+        max_entries: maximum number of snapshots
+        """
+        self.budget = budget
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return '%d snapshots, %.1f MB, %d hits, %d misses' % (
+            len(self), self.nbytes / 2. ** 20, self.hits, self.misses)
+
+    def load(self, cls, fname, *args, **kwargs):
+        """
+        Return cls(fname, *args, **kwargs), loading it only on a miss.
+        Every caller gets its own shallow copy, so that truncation is not
+        shared, while the data arrays are.
+        """
+        fname = os.path.abspath(fname)
+        st = os.stat(fname)
+        key = (cls.__name__, fname, st.st_mtime, st.st_size,
+               repr(args), repr(sorted(kwargs.items())))
+        if key in self.entries:
+            self.hits += 1
+            obj, size = self.entries.pop(key)
+        else:
+            self.misses += 1
+            obj = cls(fname, *args, **kwargs)
+            size = self.sizeof(obj)
+            self.nbytes += size
+        self.entries[key] = (obj, size)
+        self.evict()
+        return self.copy(obj)
+
+    @staticmethod
+    def copy(obj):
+        """
+        A shallow copy with its own dicts (truncated views, memoized cuts
+        and sums, ...), so that what a caller computes stays out of the
+        cached entry and its measured size
+        """
+        c = copy.copy(obj)
+        for k, v in vars(c).items():
+            if isinstance(v, (dict, LRUCache)):
+                setattr(c, k, copy.copy(v))
+        return c
+
+    def evict(self):
+        """
+        Drop the least recently used entries until the budget and the
+        entry count are met. The most recent entry is always kept.
+        """
+        while len(self.entries) > 1 and (
+                self.nbytes > self.budget or
+                len(self.entries) > self.max_entries):
+            key, (obj, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+
+    def set_budget(self, budget):
+        """
+        Change the memory budget (in bytes)
+        """
+        self.budget = budget
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    @staticmethod
+    def mapped(a):
+        """
+        Whether an array (or record) is a view of a memory map
+        """
+        while a is not None:
+            if isinstance(a, numpy.memmap):
+                return True
+            a = getattr(a, 'base', None)
+        return False
+
+    @classmethod
+    def sizeof(cls, obj):
+        """
+        Number of bytes held by the data of a PIC data object.
+        Memory-mapped data is file-backed and paged in on demand, so it is
+        not counted.
+        """
+        data = obj.data
+        if isinstance(data, dict):
+            arrays = data.values()
+        else:
+            arrays = [data]
+        return sum(numpy.asarray(v).nbytes for v in arrays
+                   if not cls.mapped(v))
+
+
+class LRUCache:
+
+    """
+    A small memo of computed values, bounded by the number of entries
+    and, optionally, by the bytes of the numpy arrays they hold.
+    Looking up an entry makes it the most recently used one.
+    """
+
+    def __init__(self, size=64, budget=None):
+        """
+        size: maximum number of entries
+        budget: maximum number of bytes (default: no limit)
+        """
+        self.size = size
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        value, size = self.entries.pop(key)
+        self.entries[key] = (value, size)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        size = self.sizeof(value)
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        self.evict()
+
+    def __copy__(self):
+        c = LRUCache(self.size, self.budget)
+        c.entries = self.entries.copy()
+        c.nbytes = self.nbytes
+        return c
+
+    def evict(self):
+        """
+        Drop the least recently used entries until both limits are met.
+        The most recent entry is always kept.
+        """
+        while len(self.entries) > 1 and (
+                len(self.entries) > self.size or
+                self.budget is not None and self.nbytes > self.budget):
+            key, (value, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    @classmethod
+    def sizeof(cls, value):
+        """
+        Bytes of the numpy arrays in a value: an array, a tuple or list,
+        or an object such as Trilinear
+        """
+        if isinstance(value, numpy.ndarray):
+            return value.nbytes
+        if isinstance(value, (tuple, list)):
+            return sum(cls.sizeof(v) for v in value)
+        if hasattr(value, '__dict__'):
+            return sum(cls.sizeof(v) for v in vars(value).values())
+        return 0
+
+
+snapshot_cache = SnapshotCache()
@@ -0,0 +1,85 @@
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Interpolation
+-------------
+"""
+
+
+import numpy
+
+
+def fractional_index(axes, v):
+    """
+    Fractional grid index of the values v on a (sorted) axes grid.
+    Values outside of the grid are mapped to -1.
+    """
+    return numpy.interp(v, axes, numpy.arange(len(axes)), left=-1, right=-1)
+
+
+class Trilinear:
+
+    """
+    Trilinear interpolation weights of a set of points in a 3D array.
+    The weights are computed once, and applying them to data with the
+    same grid is a gather and a sum, so they can be reused for many
+    data sets (e.g. all species of a distribution in one pass).
+    """
+
+    def __init__(self, shape, points):
+        """
+        shape: shape of the 3D arrays to be sampled
+        points: (3, ...) fractional indices along the three axes;
+                points outside of the grid sample as zero
+        """
+        points = numpy.asarray(points, 'f8')
+        self.shape = tuple(shape)
+        self.pshape = points.shape[1:]
+        p = points.reshape(3, -1)
+        inside = numpy.all((p >= 0) & (p <= numpy.array(shape)[:, None] - 1),
+                           axis=0)
+        i0 = []
+        t = []
+        for a in range(3):
+            n = shape[a]
+            i = numpy.clip(numpy.floor(p[a]), 0, max(n - 2, 0)).astype(int)
+            i0.append(i)
+            t.append(numpy.where(inside, p[a] - i, 0.))
+        self.index = numpy.empty((8, p.shape[1]), int)
+        self.weight = numpy.empty((8, p.shape[1]))
+        c = 0
+        for d0 in (0, 1):
+            for d1 in (0, 1):
+                for d2 in (0, 1):
+                    j = [numpy.minimum(i0[0] + d0, shape[0] - 1),
+                         numpy.minimum(i0[1] + d1, shape[1] - 1),
+                         numpy.minimum(i0[2] + d2, shape[2] - 1)]
+                    self.index[c] = numpy.ravel_multi_index(j, shape)
+                    self.weight[c] = (t[0] if d0 else 1 - t[0]) * \
+                        (t[1] if d1 else 1 - t[1]) * \
+                        (t[2] if d2 else 1 - t[2])
+                    c += 1
+        self.weight[:, ~inside] = 0.
+
+    def __call__(self, f):
+        """
+        Sample f of shape (..., n0, n1, n2) at the points; the leading
+        dimensions (e.g. species) are sampled in the same pass.
+        """
+        f = numpy.asarray(f)
+        lead = f.shape[:-3]
+        F = f.reshape(lead + (-1,))
+        A = numpy.einsum('...kn,kn->...n', F[..., self.index], self.weight)
+        return A.reshape(lead + self.pshape)
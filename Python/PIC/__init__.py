@@ -5,3 +5,9 @@ PIC data classes
 from DistNASA import *
 from FieldNASA import *
 from FieldLANL import *
+from SnapshotCache import *
+from FieldSeries import *
+from LANLRun import *
+from DistBatch import *
+from DistCatalog import *
+from Trilinear import *
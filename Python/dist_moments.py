@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+
+#    dist_moments.py:
+#       Compute the species moments (or non-Maxwellian measures) of all
+#       distribution files of a run and save them in a table keyed by
+#       bin centre.
+#
+#    Copyright (C) 2014  Jian-Ming Tang <jmtang@mailaps.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import PIC
+
+
+# main program ###
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=
+            'Compute species moments of distribution files')
+    parser.add_argument('datafiles', nargs='+', help='the input data files')
+    parser.add_argument('--grid', default=101,
+            help='number of grid points (default = 101)')
+    parser.add_argument('--nsp', default=4,
+            help='number of species (default = 4)')
+    parser.add_argument('--non-maxwellian', action='store_true',
+            help='compute the relative kinetic entropy and the L2 ' \
+                    + 'distance from the Maxwellian instead')
+    parser.add_argument('--mass',
+            help='species masses [e.g. 25,1,25,1] (default = 1)')
+    parser.add_argument('--procs',
+            help='number of worker processes (default = all CPUs)')
+    parser.add_argument('--files-per-worker', default=8,
+            help='files loaded by a worker before it is replaced')
+    parser.add_argument('--out', default='moments.npz',
+            help='output file (default = moments.npz)')
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.non_maxwellian:
+        kwargs['func'] = PIC.non_maxwellian_row
+        kwargs['dtype'] = PIC.non_maxwellian_dtype(int(args.nsp))
+    elif args.mass:
+        kwargs['mass'] = map(float, args.mass.split(','))
+    batch = PIC.DistBatch(args.datafiles, int(args.grid), int(args.nsp))
+    table = batch.run(args.out,
+                      processes=int(args.procs) if args.procs else None,
+                      maxtasksperchild=int(args.files_per_worker), **kwargs)
+    for f in batch.failed:
+        print 'Skipping ' + f
+    print '%d bins saved to %s' % (len(table), args.out)
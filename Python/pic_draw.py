@@ -250,6 +250,12 @@ class MainFrame(wx.Frame):
         Replace panel for Distribution 3D plot
         """
         self.on_file_open(None)
+        self.show_D3D()
+
+    def show_D3D(self):
+        """
+        Show the Distribution 3D plot of the current pathname
+        """
         self.replace_panel(GUI.PanelD3D(self))
         self.SetTitle(self.menu.labelD3D)
         self.menu.frame_F2D.Enable(True)
@@ -264,6 +270,16 @@ class MainFrame(wx.Frame):
         frame = GUI.FrameD2D(self.panel, title=self.menu.labelD2D)
         frame.Show()
 
+    def open_D3D(self, path):
+        """
+        Open a new root Frame with the Distribution 3D plot of a file
+        """
+        frame = MainFrame(None, title='PIC Draw')
+        frame.pathname = path
+        frame.tree.SetPath(path)
+        frame.show_D3D()
+        frame.Show()
+
     def get_path_from_dirctrl(self, event):
         f = self.tree.GetPath()
         if os.path.isfile(f):